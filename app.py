@@ -1,17 +1,33 @@
 import os
-import json
 import tempfile
 import logging
 import random
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import hashlib
+import functools
+import contextlib
+import gzip
+import itertools
+import threading
+import sqlite3
+import zipfile
+import orjson
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, send_from_directory, jsonify, redirect
+from werkzeug.exceptions import HTTPException, NotFound, InternalServerError
+from werkzeug.security import safe_join
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import genanki
+from PIL import Image, ImageOps
 from datetime import datetime
 import uuid
+import traceback
 
 # Bulletproof parser - handles LLM-generated JSON with errors
 import re
@@ -20,16 +36,40 @@ import re
 from json_repair import repair_json
 JSON_REPAIR_AVAILABLE = True
 
+# Each cache slot pins its input and the repaired output, so only payloads up to this size are cached:
+# 64 slots stay within a few tens of MB even for non-ASCII text, instead of scaling with MAX_CONTENT_LENGTH
+REPAIR_CACHE_MAX_CHARS = 64 * 1024
+
+@functools.lru_cache(maxsize=64)
+def repair_json_memo(json_str):
+    """repair_json with its results memoized - only called for inputs within REPAIR_CACHE_MAX_CHARS"""
+    return repair_json(json_str)
+
+def repair_json_cached(json_str):
+    """
+    repair_json is pure on its input string, and n8n retries resend identical payloads.
+    Cache the repaired string (immutable) - callers still parse a fresh object each time.
+    Oversized payloads are repaired without caching.
+    """
+    if len(json_str) > REPAIR_CACHE_MAX_CHARS:
+        return repair_json(json_str)
+    return repair_json_memo(json_str)
+
+# ```json ... ``` wrapper used by n8n
+JSON_FENCE_OPEN = '```json'
+JSON_FENCE_CLOSE = '```'
+
 def parse_markdown_json(raw_input):
     """
     Simple parser for n8n markdown-wrapped JSON.
     Uses json_repair library for fixing LLM-generated content.
     Expected format: ```json {...} ```
     """
-    # Step 1: Extract JSON from markdown wrapper
-    json_match = re.search(r'```json\s*(.*?)\s*```', raw_input, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(1)
+    # Step 1: Extract JSON from markdown wrapper - slice between the fences
+    start = raw_input.find(JSON_FENCE_OPEN)
+    end = raw_input.find(JSON_FENCE_CLOSE, start + len(JSON_FENCE_OPEN)) if start != -1 else -1
+    if end != -1:
+        json_str = raw_input[start + len(JSON_FENCE_OPEN):end].strip()
         app.logger.debug("Extracted JSON from markdown wrapper")
     else:
         # Maybe it's already pure JSON
@@ -39,8 +79,8 @@ def parse_markdown_json(raw_input):
     # Step 2: Use json_repair to fix any LLM mistakes
     try:
         # json_repair returns a string, so we parse it after repair
-        repaired_json = repair_json(json_str)
-        data = json.loads(repaired_json)
+        repaired_json = repair_json_cached(json_str)
+        data = orjson.loads(repaired_json)
         
         app.logger.info(f"Successfully parsed JSON with json_repair")
         return data
@@ -53,6 +93,7 @@ def parse_markdown_json(raw_input):
 from supabase_utils import (
     upload_deck_to_supabase, 
     generate_smart_deck_name,
+    sanitize_filename,
     check_supabase_health,
     SUPABASE_ENABLED
 )
@@ -60,52 +101,322 @@ from supabase_utils import (
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Datetimes are passed through to the provider's default(), so they keep Flask's http_date format
+# instead of orjson's native ISO 8601
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Route jsonify() and request.json through orjson - the same values as the default provider,
+    datetimes included (see ORJSON_OPTIONS), written as compact UTF-8 rather than ASCII-escaped
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # jsonify() - hand orjson's bytes straight to the response, no str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 # Create the app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 
+# Cap request bodies so a runaway payload can't exhaust worker memory
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+# Behind nginx/Apache, USE_X_SENDFILE=1 lets the web server stream /download files itself
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
 # Configure CORS for API endpoints
+API_CORS_METHODS = ["GET", "POST", "OPTIONS"]
+API_CORS_HEADERS = ["Content-Type", "Authorization"]
+
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "methods": API_CORS_METHODS,
+        "allow_headers": API_CORS_HEADERS
     }
 })
 
-def download_image_from_url(url, media_files_list):
-    """Download image from URL and return local filename for Anki embedding"""
-    try:
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        if not filename or '.' not in filename:
-            url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-            filename = f"image_{url_hash}.jpg"
+# Preflight response headers - mirror the CORS config above
+PREFLIGHT_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', ', '.join(API_CORS_METHODS)),
+    ('Access-Control-Allow-Headers', ', '.join(API_CORS_HEADERS)),
+    ('Content-Length', '0')
+]
+
+def options_shortcut(wsgi_app):
+    """Answer CORS preflight for /api/* directly, before Flask routing and dispatch run"""
+    def wrapped(environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'OPTIONS' and environ.get('PATH_INFO', '').startswith('/api/'):
+            start_response('204 No Content', PREFLIGHT_HEADERS)
+            return []
+        return wsgi_app(environ, start_response)
+    return wrapped
 
-        valid_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp']
-        if not any(filename.lower().endswith(ext) for ext in valid_extensions):
-            filename += '.jpg'
+app.wsgi_app = options_shortcut(app.wsgi_app)
 
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+# Persistent .apkg storage - resolved and created once at startup
+DOWNLOADS_DIR = os.path.join(os.getcwd(), 'downloads')
+os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+# Image download constants - built once instead of on every call
+VALID_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp')
+IMAGE_DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Refuse anything bigger - a single huge image shouldn't balloon a worker's memory
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+# Cards show images at most 70% wide / 400px tall, so large photos are shrunk and re-encoded as WebP.
+# Small images, SVGs and (possibly animated) GIFs are embedded as downloaded.
+IMAGE_TRANSCODE_MIN_BYTES = 256 * 1024
+IMAGE_MAX_DIMENSION = 1200
+IMAGE_WEBP_QUALITY = 80
+IMAGE_KEEP_FORMAT_EXTENSIONS = ('.svg', '.gif')
+
+# Image downloads are pure network waits - a shared pool overlaps them across a deck
+IMAGE_DOWNLOAD_WORKERS = int(os.environ.get('IMG_DOWNLOAD_WORKERS', 25))
+image_download_pool = ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS, thread_name_prefix='image-download')
+
+# Fail fast on unreachable hosts, but give slow image servers time to send the body
+IMAGE_DOWNLOAD_TIMEOUT = (5, 30)
+# The read timeout applies per read, so a server trickling bytes could stall forever - cap each download's
+# total time, and how long a deck waits for all of its images (queueing behind other downloads included)
+IMAGE_DOWNLOAD_DEADLINE = 60
+IMAGE_BATCH_DEADLINE = 90
+
+# One session for all image fetches so keep-alive connections are reused.
+# The pool is sized to the download workers; transient 5xx and connection errors are retried with backoff.
+IMAGE_SESSION = requests.Session()
+IMAGE_SESSION.headers.update(IMAGE_DOWNLOAD_HEADERS)
+_image_adapter = HTTPAdapter(
+    pool_connections=IMAGE_DOWNLOAD_WORKERS,
+    pool_maxsize=IMAGE_DOWNLOAD_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+)
+IMAGE_SESSION.mount('https://', _image_adapter)
+IMAGE_SESSION.mount('http://', _image_adapter)
+
+@functools.lru_cache(maxsize=4096)
+def image_filename_for_url(url):
+    """Derive the local media filename for an image URL - pure, so repeated URLs are free"""
+    parsed_url = urlparse(url)
+    filename = os.path.basename(parsed_url.path)
+    if not filename or '.' not in filename:
+        url_hash = hashlib.blake2b(url.encode(), digest_size=4, usedforsecurity=False).hexdigest()
+        filename = f"image_{url_hash}.jpg"
+
+    if not filename.lower().endswith(VALID_IMAGE_EXTENSIONS):
+        filename += '.jpg'
+
+    return filename
+
+def transcode_image(filename, data):
+    """Shrink an oversized image and re-encode it as WebP; returns (filename, data), unchanged if that doesn't help"""
+    if len(data) <= IMAGE_TRANSCODE_MIN_BYTES or filename.lower().endswith(IMAGE_KEEP_FORMAT_EXTENSIONS):
+        return filename, data
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # The WebP carries no EXIF orientation - rotate phone photos upright before re-encoding
+            image = ImageOps.exif_transpose(image)
+            if image.mode.startswith('I'):
+                # 16-bit grayscale (common for X-rays) - convert('RGB') would clip it to white, so scale it to 8 bits
+                image = image.convert('I')
+                low, high = image.getextrema()
+                if low < 0 or high > 0xFFFF:
+                    return filename, data
+                image = image.point(lambda value: value * (1 / 257)).convert('L')
+            elif image.mode == 'F':
+                # Floating-point pixels have no fixed range to scale from - embed as downloaded
+                return filename, data
+            image.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.mode or 'transparency' in image.info else 'RGB')
+            output = BytesIO()
+            image.save(output, format='WEBP', quality=IMAGE_WEBP_QUALITY, method=4)
+    except Exception as e:
+        app.logger.warning(f"Could not transcode {filename}, embedding original: {e}")
+        return filename, data
+
+    webp_data = output.getvalue()
+    if len(webp_data) >= len(data):
+        return filename, data
+
+    # Keep the original name as a prefix so a.png and a.jpg don't collide
+    return f"{filename}.webp", webp_data
+
+# Downloaded (and transcoded) images are kept across requests and restarts, keyed by a hash of the URL.
+# Shared diagrams are fetched once; the least recently used files are pruned past IMAGE_CACHE_MAX_BYTES.
+# Kept outside DOWNLOADS_DIR, since everything in there is reachable through /download. The default
+# temp directory survives process restarts; point IMAGE_CACHE_DIR at persistent storage to keep it across reboots.
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'anki-image-cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+IMAGE_CACHE_PRUNE_EVERY = 64 * 1024 * 1024
+os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+image_cache_lock = threading.Lock()
+image_cache_written = 0
+
+@functools.lru_cache(maxsize=4096)
+def image_cache_path(url):
+    """Cache file path for a URL, without the '.webp' suffix transcoded images get - hashed once per URL"""
+    url_hash = hashlib.blake2b(url.encode(), digest_size=16, usedforsecurity=False).hexdigest()
+    return os.path.join(IMAGE_CACHE_DIR, url_hash)
+
+def read_cached_image(url):
+    """Return (filename, data) for a previously downloaded URL, or None"""
+    cache_path = image_cache_path(url)
+    for suffix in ('.webp', ''):
+        try:
+            with open(cache_path + suffix, 'rb') as f:
+                data = f.read()
+            # Mark as recently used so pruning keeps it
+            os.utime(cache_path + suffix)
+        except OSError:
+            continue
+        return image_filename_for_url(url) + suffix, data
+    return None
 
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
+def store_cached_image(url, filename, data):
+    """Save a downloaded image to the cache, pruning it once enough new data has been written"""
+    global image_cache_written
+    # filename is the URL's base filename plus '.webp' if it was transcoded - keep that suffix
+    cache_path = image_cache_path(url) + filename[len(image_filename_for_url(url)):]
+    temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    try:
         with open(temp_path, 'wb') as f:
-            f.write(response.content)
+            f.write(data)
+        # Atomic rename - other threads and workers never read a half-written file
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        app.logger.warning(f"Could not cache image {url}: {e}")
+        return
+
+    with image_cache_lock:
+        image_cache_written += len(data)
+        if image_cache_written < IMAGE_CACHE_PRUNE_EVERY:
+            return
+        image_cache_written = 0
+    try:
+        prune_image_cache()
+    except OSError as e:
+        # Housekeeping only (e.g. a tmp cleaner removed the cache directory) - the download itself succeeded
+        app.logger.warning(f"Could not prune image cache: {e}")
+
+def prune_image_cache():
+    """Delete the least recently used cached images until the cache fits IMAGE_CACHE_MAX_BYTES"""
+    entries = []
+    with os.scandir(IMAGE_CACHE_DIR) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= IMAGE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
 
-        media_files_list.append(temp_path)
-        return filename
+def download_image_from_url(url):
+    """Download image from URL (or the image cache) and return (filename, data) for Anki embedding, or None on failure"""
+    try:
+        cached = read_cached_image(url)
+        if cached:
+            return cached
+
+        filename = image_filename_for_url(url)
+        deadline = time.monotonic() + IMAGE_DOWNLOAD_DEADLINE
+
+        # Kept in memory - the bytes go straight into the .apkg zip, no temp file to write, re-read and delete
+        with IMAGE_SESSION.get(url, timeout=IMAGE_DOWNLOAD_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > IMAGE_MAX_BYTES:
+                raise ValueError(f"image is {content_length} bytes, limit is {IMAGE_MAX_BYTES}")
+
+            # Content-Length can be missing or wrong - enforce the limit while reading too
+            buffer = bytearray()
+            for chunk in response.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                buffer += chunk
+                if len(buffer) > IMAGE_MAX_BYTES:
+                    raise ValueError(f"image exceeds {IMAGE_MAX_BYTES} bytes")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"image took longer than {IMAGE_DOWNLOAD_DEADLINE}s to download")
+            data = bytes(buffer)
+
+        filename, data = transcode_image(filename, data)
+        store_cached_image(url, filename, data)
+        return filename, data
     except Exception as e:
         app.logger.error(f"Error downloading image from {url}: {e}")
         return None
 
-def create_enhanced_medical_model():
-    """Create enhanced medical model with minimal CSS - let HTML handle styling"""
-    minimal_css = """
+# Downloads currently running, keyed by URL - concurrent requests for the same image share one fetch
+inflight_downloads = {}
+inflight_downloads_lock = threading.Lock()
+
+def forget_download(url, future):
+    """Drop a finished download from the in-flight map"""
+    with inflight_downloads_lock:
+        if inflight_downloads.get(url) is future:
+            del inflight_downloads[url]
+
+def download_images(urls):
+    """Download every URL concurrently and return a {url: (filename, data) or None} map"""
+    futures = {}
+    started = []
+    with inflight_downloads_lock:
+        for url in dict.fromkeys(urls):
+            future = inflight_downloads.get(url)
+            if future is None:
+                future = image_download_pool.submit(download_image_from_url, url)
+                inflight_downloads[url] = future
+                started.append((url, future))
+            futures[url] = future
+
+    # Outside the lock - a future that already finished runs its callback right here
+    for url, future in started:
+        future.add_done_callback(functools.partial(forget_download, url))
+
+    # One deadline for the whole batch - an image that isn't ready by then is treated as a failed download
+    deadline = time.monotonic() + IMAGE_BATCH_DEADLINE
+    results = {}
+    for url, future in futures.items():
+        try:
+            results[url] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            app.logger.error(f"Timed out waiting for image {url}")
+            results[url] = None
+    return results
+
+@functools.lru_cache(maxsize=None)
+def get_genanki():
+    """Import genanki on first use so workers that never build a deck skip the import"""
+    import genanki
+    return genanki
+
+# Model definitions - shared by every deck, so defined once at module level
+MINIMAL_CSS = """
 /* Minimal base styles */
 .card { 
     font-family: Arial, sans-serif;
@@ -139,78 +450,118 @@ div[style*="margin-top: 20px"][style*="margin-bottom: 20px"] {
 }
 """
 
-    fields = [
-        {'name': 'Front'},
-        {'name': 'Back'}
-    ]
+MEDICAL_FIELDS = [
+    {'name': 'Front'},
+    {'name': 'Back'}
+]
 
-    templates = [
-        {
-            'name': 'Medical Card',
-            'qfmt': '''{{Front}}''',
-            'afmt': '''{{FrontSide}}
+MEDICAL_TEMPLATES = [
+    {
+        'name': 'Medical Card',
+        'qfmt': '''{{Front}}''',
+        'afmt': '''{{FrontSide}}
 <hr id="answer">
 {{Back}}'''
-        }
-    ]
+    }
+]
 
-    # Handle both basic and cloze cards
-    cloze_template = {
+# Handle both basic and cloze cards
+CLOZE_FIELDS = [{'name': 'Text'}]
+
+CLOZE_TEMPLATES = [
+    {
         'name': 'Cloze Card',
         'qfmt': '''{{cloze:Text}}''',
         'afmt': '''{{cloze:Text}}'''
     }
+]
+
+def create_enhanced_medical_model():
+    """Create enhanced medical model with minimal CSS - let HTML handle styling"""
+    genanki = get_genanki()
 
     model = genanki.Model(
         1607392320,
         'Enhanced Medical Cards',
-        fields=fields,
-        templates=templates,
-        css=minimal_css
+        fields=MEDICAL_FIELDS,
+        templates=MEDICAL_TEMPLATES,
+        css=MINIMAL_CSS
     )
 
     # Create a separate cloze model
     cloze_model = genanki.Model(
         1607392321,
         'Enhanced Medical Cloze',
-        fields=[{'name': 'Text'}],
-        templates=[cloze_template],
-        css=minimal_css,
+        fields=CLOZE_FIELDS,
+        templates=CLOZE_TEMPLATES,
+        css=MINIMAL_CSS,
         model_type=1  # Cloze type
     )
 
     return model, cloze_model
 
+@functools.lru_cache(maxsize=None)
+def get_enhanced_models():
+    """Models are identical for every request - build them once per process, on first use"""
+    return create_enhanced_medical_model()
+
+# Every embedded image uses the same centered wrapper
+IMAGE_HTML = '<div style="text-align: center;"><img src="%s" style="width: 70%%; max-height: 400px; height: auto; object-fit: contain; margin: 10px auto; display: block;"></div>'
+
+# Anki tags can't contain spaces
+TAG_SPACE_TABLE = str.maketrans(' ', '_')
+TAG_SPLIT_RE = re.compile(r'::|[,;]')
+
+# Everything _format_notes rewrites or needs to know about, matched in a single scan
+NOTES_FIXUP_RE = re.compile(r'style="|<div|margin-top: 10px|margin-top: 20px|margin-bottom: 20px')
+
+# Progress logging granularity for process_cards
+CARD_LOG_INTERVAL = 100
+
 class EnhancedFlashcardProcessor:
+    __slots__ = ('basic_model', 'cloze_model')
+
     def __init__(self):
-        self.basic_model, self.cloze_model = create_enhanced_medical_model()
+        self.basic_model, self.cloze_model = get_enhanced_models()
 
     def process_cards(self, cards_data, deck_name="Medical Deck"):
         deck_id = random.randrange(1 << 30, 1 << 31)
-        deck = genanki.Deck(deck_id, deck_name)
+        deck = get_genanki().Deck(deck_id, deck_name)
         media_files = []
+        notes = []
+
+        # First pass: fetch every distinct image URL in the deck at once instead of one by one while building notes
+        image_files = download_images(
+            url for card_info in cards_data for url in self._image_urls(card_info)
+        )
 
+        card_count = len(cards_data)
         for card_index, card_info in enumerate(cards_data):
-            app.logger.info(f"Processing card {card_index + 1}/{len(cards_data)}")
+            # One progress line per CARD_LOG_INTERVAL cards instead of one per card
+            if card_index % CARD_LOG_INTERVAL == 0:
+                app.logger.info("Processing card %d/%d", card_index + 1, card_count)
 
-            # Defensive check: ensure card_info is a dictionary
-            if not isinstance(card_info, dict):
-                app.logger.error(f"Card {card_index + 1} is not a dictionary, got: {type(card_info)}, value: {card_info}")
-                continue
+            # extract_cards already dropped anything that is not a dict (stripped under python -O)
+            assert isinstance(card_info, dict), f"Card {card_index + 1} is not a dictionary: {type(card_info)}"
 
             card_type = card_info.get('type', 'basic').lower()
 
             if card_type == 'cloze':
                 # Process cloze card
-                self._process_cloze_card(deck, card_info, media_files)
+                notes.append(self._process_cloze_card(card_info, media_files, image_files))
             else:
                 # Process basic card
-                self._process_basic_card(deck, card_info, media_files, deck_id, card_index)
+                notes.append(self._process_basic_card(card_info, media_files, image_files))
 
-        return deck, media_files
+        # Deck.notes is a plain list - add every note in one extend
+        deck.notes.extend(notes)
+        app.logger.info("Built %d notes from %d cards", len(notes), card_count)
 
-    def _process_cloze_card(self, deck, card_info, media_files):
-        """Process a cloze deletion card"""
+        # Reused images (same URL in several cards) share one filename - package each once
+        return deck, list(dict(media_files).items())
+
+    def _process_cloze_card(self, card_info, media_files, image_files):
+        """Build the note for a cloze deletion card"""
         # For cloze cards, combine all content into the Text field
         content_parts = []
 
@@ -220,21 +571,20 @@ class EnhancedFlashcardProcessor:
             content_parts.append(front_html)
 
         # Add any additional components
-        self._add_common_components(content_parts, card_info, media_files)
+        self._add_common_components(content_parts, card_info, media_files, image_files)
 
         # Combine all parts
         full_content = '\n'.join(content_parts)
 
         # Create cloze note
-        note = genanki.Note(
+        return get_genanki().Note(
             model=self.cloze_model,
-            fields=[full_content],
+            fields=(full_content,),
             tags=self._process_tags(card_info.get('tags', []))
         )
-        deck.add_note(note)
 
-    def _process_basic_card(self, deck, card_info, media_files, deck_id, card_index):
-        """Process a basic (front/back) card"""
+    def _process_basic_card(self, card_info, media_files, image_files):
+        """Build the note for a basic (front/back) card"""
         # FRONT: Use exactly as provided
         front_html = card_info.get('front', '')
 
@@ -247,74 +597,111 @@ class EnhancedFlashcardProcessor:
             back_parts.append(back_text)
 
         # Add common components
-        self._add_common_components(back_parts, card_info, media_files)
+        self._add_common_components(back_parts, card_info, media_files, image_files)
 
         # Combine all back parts
         back_content = '\n'.join(back_parts)
 
         # Create note with front and back
-        note = genanki.Note(
+        return get_genanki().Note(
             model=self.basic_model,
-            fields=[front_html, back_content],
+            fields=(front_html, back_content),
             tags=self._process_tags(card_info.get('tags', []))
         )
-        deck.add_note(note)
 
     def _process_tags(self, tags):
         """Process tags safely, handling both strings and lists"""
         if not tags:
             return []
         
-        # If it's a string, split by common delimiters
+        # If it's a string, split by comma, semicolon, or double colon in one pass
         if isinstance(tags, str):
-            # Split by comma, semicolon, or double colon
-            if '::' in tags:
-                tag_list = tags.split('::')
-            elif ',' in tags:
-                tag_list = tags.split(',')
-            elif ';' in tags:
-                tag_list = tags.split(';')
-            else:
-                tag_list = [tags]
+            tag_list = TAG_SPLIT_RE.split(tags)
         elif isinstance(tags, list):
             tag_list = tags
         else:
             app.logger.warning(f"Unknown tags format: {type(tags)}, value: {tags}")
             return []
         
-        # Clean up tags and replace spaces with underscores
-        return [tag.strip().replace(' ', '_') for tag in tag_list if tag.strip()]
+        # Clean up tags and replace spaces with underscores - strip each tag once
+        return [stripped.translate(TAG_SPACE_TABLE) for tag in tag_list if (stripped := tag.strip())]
+
+    @staticmethod
+    def _image_urls(card_info):
+        """Yield every downloadable image URL a card references, mirroring _add_common_components"""
+        for image_item in card_info.get('images', []) or ():
+            if isinstance(image_item, str) and image_item.startswith('http'):
+                yield image_item
+            elif isinstance(image_item, dict):
+                image_url = image_item.get('url', '')
+                if image_url and image_url.startswith('http'):
+                    yield image_url
 
-    def _add_common_components(self, content_parts, card_info, media_files):
-        """Add common components - NOTES NOW ADDED LAST"""
-        # Defensive check: ensure card_info is a dictionary
-        if not isinstance(card_info, dict):
-            app.logger.warning(f"card_info is not a dictionary in _add_common_components: {type(card_info)}")
+        image_data = card_info.get('image', '')
+        if isinstance(image_data, dict):
+            image_data = image_data.get('url', '')
+        if isinstance(image_data, str) and image_data.startswith('http'):
+            yield image_data
+
+    @staticmethod
+    def _use_image(url, image_files, media_files):
+        """Return the prefetched filename for url and register its data with the deck media"""
+        downloaded = image_files.get(url)
+        if downloaded is None:
+            return None
+        media_files.append(downloaded)
+        return downloaded[0]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _format_notes(notes):
+        """
+        Center the notes and fix their spacing in one regex pass, preserving the original font size.
+        Pure on the notes string - generated decks repeat boilerplate notes, so results are cached.
+        """
+        # Only add centering if not present - into existing style attributes, else onto the divs
+        add_center = 'text-align: center' not in notes
+        center_in_style = add_center and 'style="' in notes
+        center_on_div = add_center and not center_in_style
+        seen_margins = set()
+
+        def fixup(match):
+            token = match.group()
+            if token == 'style="':
+                return 'style="text-align: center; ' if center_in_style else token
+            if token == '<div':
+                return '<div style="text-align: center;"' if center_on_div else token
+            # Ensure proper spacing but preserve font size
+            seen_margins.add(token)
+            return 'margin-top: 20px' if token == 'margin-top: 10px' else token
+
+        notes = NOTES_FIXUP_RE.sub(fixup, notes)
+
+        # Add spacing wrapper if no spacing was present - no font size change
+        if not seen_margins and not notes.startswith('<div'):
+            notes = f'<div style="text-align: center; font-style: italic; margin-top: 20px; color: #FF1493;">{notes}</div>'
+
+        return notes
+
+    def _emit_image(self, content_parts, image_url, image_caption, image_files, media_files):
+        """Append a downloaded image, followed immediately by its caption if it has one"""
+        if not (image_url and image_url.startswith('http')):
             return
-        
+        downloaded_filename = self._use_image(image_url, image_files, media_files)
+        if downloaded_filename:
+            content_parts.append(IMAGE_HTML % downloaded_filename)
+            if image_caption:
+                content_parts.append(image_caption)
+
+    def _add_common_components(self, content_parts, card_info, media_files, image_files):
+        """Add common components - NOTES NOW ADDED LAST"""
         # Store notes to add at the end
         notes_content = None
         
         # 1. Check for notes but don't add yet - preserve original font size
         notes = card_info.get('notes', '')
         if notes:
-            # Only add centering if not present, preserve original font size
-            if 'text-align: center' not in notes:
-                # If notes don't have center alignment, add it
-                if 'style="' in notes:
-                    notes = notes.replace('style="', 'style="text-align: center; ')
-                elif '<div' in notes:
-                    notes = notes.replace('<div', '<div style="text-align: center;"')
-            
-            # Ensure proper spacing but preserve font size
-            if 'margin-top: 10px' in notes:
-                notes = notes.replace('margin-top: 10px', 'margin-top: 20px')
-            elif 'margin-top: 20px' not in notes and 'margin-bottom: 20px' not in notes:
-                # Add spacing wrapper if not present - no font size change
-                if not notes.startswith('<div'):
-                    notes = f'<div style="text-align: center; font-style: italic; margin-top: 20px; color: #FF1493;">{notes}</div>'
-            
-            notes_content = notes
+            notes_content = self._format_notes(notes)
 
         # 2. Images handling with captions
         # Check for 'images' array first (from n8n processing)
@@ -322,44 +709,23 @@ class EnhancedFlashcardProcessor:
         if images:
             for image_item in images:
                 # Handle both string URLs and objects with URL/caption
-                if isinstance(image_item, str) and image_item.startswith('http'):
+                if isinstance(image_item, str):
                     # Simple URL string
-                    downloaded_filename = download_image_from_url(image_item, media_files)
-                    if downloaded_filename:
-                        content_parts.append(f'<div style="text-align: center;"><img src="{downloaded_filename}" style="width: 70%; max-height: 400px; height: auto; object-fit: contain; margin: 10px auto; display: block;"></div>')
+                    self._emit_image(content_parts, image_item, '', image_files, media_files)
                 elif isinstance(image_item, dict):
                     # Object with url and caption
-                    image_url = image_item.get('url', '')
-                    image_caption = image_item.get('caption', '')
-
-                    if image_url and image_url.startswith('http'):
-                        downloaded_filename = download_image_from_url(image_url, media_files)
-                        if downloaded_filename:
-                            content_parts.append(f'<div style="text-align: center;"><img src="{downloaded_filename}" style="width: 70%; max-height: 400px; height: auto; object-fit: contain; margin: 10px auto; display: block;"></div>')
-                            # Add caption immediately after image if it exists
-                            if image_caption:
-                                content_parts.append(image_caption)
+                    self._emit_image(content_parts, image_item.get('url', ''), image_item.get('caption', ''),
+                                     image_files, media_files)
 
         # Also check for 'image' field (legacy support) - can be string URL or object
         image_data = card_info.get('image', '')
         if image_data:
-            image_url = ''
-            image_caption = ''
-            
             # Handle both string URLs and objects
             if isinstance(image_data, str):
-                image_url = image_data
+                self._emit_image(content_parts, image_data, '', image_files, media_files)
             elif isinstance(image_data, dict):
-                image_url = image_data.get('url', '')
-                image_caption = image_data.get('caption', '')
-
-            if image_url and image_url.startswith('http'):
-                downloaded_filename = download_image_from_url(image_url, media_files)
-                if downloaded_filename:
-                    content_parts.append(f'<div style="text-align: center;"><img src="{downloaded_filename}" style="width: 70%; max-height: 400px; height: auto; object-fit: contain; margin: 10px auto; display: block;"></div>')
-                    # Add caption immediately after image
-                    if image_caption:
-                        content_parts.append(image_caption)
+                self._emit_image(content_parts, image_data.get('url', ''), image_data.get('caption', ''),
+                                 image_files, media_files)
 
         # 3. Clinical vignette - comes AFTER images and captions
         clinical_vignette = card_info.get('clinical_vignette', '')
@@ -391,86 +757,390 @@ class EnhancedFlashcardProcessor:
         if notes_content:
             content_parts.append(notes_content)
 
+def read_json_body():
+    """
+    Read the request body once and parse it with orjson.
+    Bypasses Flask's body and JSON caches - returns None for an empty body.
+    """
+    raw = request.get_data(cache=False)
+    return orjson.loads(raw) if raw else None
+
+@functools.lru_cache(maxsize=None)
+def get_flashcard_processor():
+    """The processor only holds the shared models - one instance serves every request"""
+    return EnhancedFlashcardProcessor()
+
 def extract_deck_name(data):
     """Extract deck name from various data formats or use smart naming"""
     # First try traditional deck_name field
-    if isinstance(data, list) and len(data) > 0:
-        if isinstance(data[0], dict) and 'deck_name' in data[0]:
-            return data[0].get('deck_name')
-    elif isinstance(data, dict):
-        deck_name = data.get('deck_name')
-        if deck_name:
+    match data:
+        case [{'deck_name': deck_name}, *_]:
+            return deck_name
+        case {'deck_name': deck_name} if deck_name:
             return deck_name
     
     # If no deck_name provided, we'll use smart naming from tags later
     return None
 
-def extract_cards(data):
-    """Extract cards from various data formats including nested card wrappers"""
-    cards = []
-    
+def iter_raw_cards(data):
+    """Yield the card items of any supported payload shape, flattening arrays of {'cards': [...]} objects"""
     # Handle the structure from your n8n output
-    if isinstance(data, dict) and 'cards' in data:
-        cards = data['cards']
-    elif isinstance(data, list):
-        # Check if it's an array with objects containing 'cards'
-        if len(data) > 0 and isinstance(data[0], dict) and 'cards' in data[0]:
-            # Flatten all cards from all objects in the array
-            all_cards = []
+    match data:
+        case {'cards': list() as cards}:
+            yield from cards
+        case [{'cards': _}, *_]:
             for item in data:
-                if isinstance(item, dict) and 'cards' in item:
-                    item_cards = item['cards']
-                    if isinstance(item_cards, list):
-                        all_cards.extend(item_cards)
-            cards = all_cards
-        else:
-            cards = data
-    
-    # Process cards and handle nested "card" wrappers
-    if isinstance(cards, list):
-        valid_cards = []
-        for i, card_item in enumerate(cards):
-            if isinstance(card_item, dict):
-                # Check if this item has a nested "card" wrapper
-                if 'card' in card_item and isinstance(card_item['card'], dict):
-                    # Extract the nested card
-                    valid_cards.append(card_item['card'])
-                    app.logger.debug(f"Extracted nested card with ID: {card_item['card'].get('card_id', 'unknown')}")
-                else:
-                    # Direct card format
-                    valid_cards.append(card_item)
-            else:
-                app.logger.warning(f"Skipping invalid card at index {i}: {type(card_item)} - {card_item}")
-        return valid_cards
-    
-    return []
+                match item:
+                    case {'cards': list() as item_cards}:
+                        yield from item_cards
+        case list():
+            yield from data
 
-@app.route('/api/enhanced-medical', methods=['POST', 'OPTIONS'])
-def api_enhanced_medical():
-    if request.method == 'OPTIONS':
-        return '', 200
+def extract_cards(data):
+    """Extract cards from various data formats including nested card wrappers - one pass over the cards"""
+    valid_cards = []
+    for i, card_item in enumerate(iter_raw_cards(data)):
+        if not isinstance(card_item, dict):
+            # Message is only formatted if the record is actually emitted
+            app.logger.warning("Skipping invalid card at index %d: %s - %r", i, type(card_item), card_item)
+            continue
+
+        # Unwrap nested "card" wrappers - one lookup
+        nested_card = card_item.get('card')
+        valid_cards.append(nested_card if isinstance(nested_card, dict) else card_item)
+    return valid_cards
+
+def write_apkg(deck, media_files, file):
+    """
+    genanki.Package.write_to_file, but media comes from in-memory (filename, data) pairs
+    instead of paths on disk, and the collection database never touches the filesystem:
+    it is built in an in-memory SQLite database (no journal, no fsync) and serialized into the zip.
+    """
+    package = get_genanki().Package(deck)
+
+    conn = sqlite3.connect(':memory:')
+    try:
+        timestamp = time.time()
+        package.write_to_db(conn.cursor(), timestamp, itertools.count(int(timestamp * 1000)))
+        conn.commit()
+        collection = conn.serialize()
+    finally:
+        conn.close()
+
+    with zipfile.ZipFile(file, 'w') as outzip:
+        outzip.writestr('collection.anki2', collection)
+        outzip.writestr('media', orjson.dumps({str(idx): filename for idx, (filename, _) in enumerate(media_files)}))
+        for idx, (_, data) in enumerate(media_files):
+            outzip.writestr(str(idx), data)
+
+def deck_filename(deck_name):
+    """Return the timestamped .apkg filename for a deck"""
+    safe_name = sanitize_filename(deck_name)
+    if not safe_name:
+        safe_name = "medical_deck"
+
+    # Timestamp for readability, random suffix so two decks with the same name in the same second don't collide
+    timestamp = int(time.time())
+    return f"{safe_name}_{timestamp}_{uuid.uuid4().hex[:8]}.apkg"
+
+def write_deck_package(deck, media_files, deck_name):
+    """
+    Write a deck to a persistent .apkg in the downloads directory.
+    This is the blocking zip+SQLite part of every conversion, kept in one place.
+    Returns (filename, file_path, file_size).
+    """
+    # Generate filename and use persistent downloads directory
+    filename = deck_filename(deck_name)
+
+    # Files persist permanently - no automatic cleanup
+    # Use /api/cleanup endpoint if manual cleanup is needed
+
+    file_path = os.path.join(DOWNLOADS_DIR, filename)
+
+    # Write package through our own handle - its final offset is the file size, no extra stat.
+    # Written under a temporary name and renamed, so /download never serves a half-written deck
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as apkg_file:
+            write_apkg(deck, media_files, apkg_file)
+            file_size = apkg_file.tell()
+        os.replace(temp_path, file_path)
+    except BaseException:
+        # open() itself may have failed (ENOSPC, EACCES) - don't let a missing temp file hide that error
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+    app.logger.info(f"Generated deck: {file_path} (size: {file_size} bytes)")
+
+    return filename, file_path, file_size
+
+# Recently generated decks, keyed by a hash of (deck name, cards, session, user).
+# Identical payloads (n8n retries, client refreshes) reuse the file already on disk - and its upload,
+# which is why the session and user are part of the key: their uploads go to different storage paths.
+RECENT_DECKS_MAX = 256
+recent_decks = OrderedDict()
+recent_decks_lock = threading.Lock()
+
+def deck_cache_key(deck_name, cards, session_id=None, user_id=None):
+    """Stable digest of a deck request - key order inside cards doesn't matter"""
+    payload = orjson.dumps([deck_name, cards, session_id, user_id], option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(payload, digest_size=16, usedforsecurity=False).digest()
+
+def get_recent_deck(key):
+    """Return (filename, file_path, file_size, media_count) if the deck is still on disk"""
+    with recent_decks_lock:
+        entry = recent_decks.get(key)
+    if entry is None:
+        return None
+
+    # The existence check is a stat - done outside the lock so other requests don't queue behind the disk
+    exists = os.path.exists(entry[1])
+    with recent_decks_lock:
+        if recent_decks.get(key) is not entry:
+            # Replaced or evicted meanwhile - treat as a miss
+            return None
+        if not exists:
+            # Removed by /api/cleanup - regenerate
+            del recent_decks[key]
+            return None
+        recent_decks.move_to_end(key)
+    return entry
+
+def remember_deck(key, entry):
+    with recent_decks_lock:
+        recent_decks[key] = entry
+        recent_decks.move_to_end(key)
+        while len(recent_decks) > RECENT_DECKS_MAX:
+            recent_decks.popitem(last=False)
+
+def build_deck(cards, deck_name, session_id=None, user_id=None):
+    """
+    Process cards and write the .apkg, reusing the file from an identical recent request
+    by the same session and user. Returns (filename, file_path, file_size, media_count).
+    """
+    cache_key = deck_cache_key(deck_name, cards, session_id, user_id)
+    cached_deck = get_recent_deck(cache_key)
+    if cached_deck:
+        app.logger.info(f"Reusing recently generated deck: {cached_deck[1]}")
+        return cached_deck
+
+    # Process cards
+    processor = get_flashcard_processor()
+    deck, media_files = processor.process_cards(cards, deck_name)
+
+    # Write the .apkg (package build, file write, media cleanup)
+    filename, file_path, file_size = write_deck_package(deck, media_files, deck_name)
+
+    entry = (filename, file_path, file_size, len(media_files))
+    remember_deck(cache_key, entry)
+    return entry
+
+# Public base URL for local download links - read once, not per response
+BASE_URL = os.environ.get('BASE_URL', '').rstrip('/')
+
+def local_download_urls(filename):
+    """Return (download_url, full_download_url) for a deck served from downloads/"""
+    download_url = f"/download/{filename}"
+    base_url = BASE_URL
+    if not base_url:
+        # Get the proper host URL from request headers
+        host = request.headers.get('Host') or request.host
+        # Use https for non-localhost hosts
+        protocol = 'https' if 'localhost' not in host and '127.0.0.1' not in host else 'http'
+        base_url = f"{protocol}://{host}"
+    return download_url, f"{base_url}{download_url}"
+
+# Inline decks stay in memory up to this size before spilling to a temp file
+INLINE_SPOOL_MAX = 16 * 1024 * 1024
+
+def inline_deck_response(cards, deck_name):
+    """Build the deck and return the .apkg itself instead of a download link"""
+    processor = get_flashcard_processor()
+    deck, media_files = processor.process_cards(cards, deck_name)
+
+    apkg_buffer = tempfile.SpooledTemporaryFile(max_size=INLINE_SPOOL_MAX)
+    write_apkg(deck, media_files, apkg_buffer)
+    apkg_buffer.seek(0)
+
+    return send_file(
+        apkg_buffer,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=deck_filename(deck_name)
+    )
+
+# Background Supabase uploads, one per deck file - filenames are unique per build and each build
+# belongs to one session and user (see deck_cache_key). The outcome of each upload is written to
+# UPLOAD_RECORDS_DIR, so every gunicorn worker (and the next process after a restart) can answer
+# /api/upload-status and /download for it.
+UPLOAD_WORKERS = 4
+UPLOAD_RECORDS_DIR = os.environ.get('UPLOAD_RECORDS_DIR', os.path.join(os.getcwd(), 'upload_records'))
+os.makedirs(UPLOAD_RECORDS_DIR, exist_ok=True)
+upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='supabase-upload')
+# Uploads queued by this process - only to avoid queueing the same deck twice
+pending_uploads = set()
+pending_uploads_lock = threading.Lock()
+
+def upload_record_path(filename):
+    """Record file for a deck's upload, or None if the filename would escape UPLOAD_RECORDS_DIR"""
+    return safe_join(UPLOAD_RECORDS_DIR, f"{filename}.json")
+
+def load_upload_record(filename):
+    """Return the stored upload result for a deck, or None if its upload hasn't finished (or never started)"""
+    record_path = upload_record_path(filename)
+    if record_path is None:
+        return None
+    try:
+        with open(record_path, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
 
+def save_upload_record(filename, record):
+    """Write an upload result atomically - readers in other workers never see a partial record"""
+    record_path = upload_record_path(filename)
+    temp_path = f"{record_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(orjson.dumps(record))
+        os.replace(temp_path, record_path)
+    except OSError as e:
+        app.logger.error(f"Could not save upload record for {filename}: {e}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+
+def finished_upload(filename):
+    """Return the Supabase upload result for a deck once it has succeeded, else None"""
+    record = load_upload_record(filename)
+    return record if record and record.get('success') else None
+
+def run_upload(filename, file_path, deck_name, session_id, user_id):
+    """Upload a deck and record the outcome. The local file is kept, so /download serves it from any worker"""
+    try:
+        result = upload_deck_to_supabase(
+            file_path,
+            deck_name,
+            session_id=session_id,
+            user_id=user_id,
+            delete_local=False
+        )
+        save_upload_record(filename, result if result and result.get('success') else {'success': False})
+    finally:
+        with pending_uploads_lock:
+            pending_uploads.discard(filename)
+
+def start_upload(filename, file_path, deck_name, session_id=None, user_id=None):
+    """
+    Queue the Supabase upload for a deck file, unless it is already queued here
+    or already uploaded (a reused deck from the recent-deck cache).
+    """
+    if finished_upload(filename):
+        return
+    with pending_uploads_lock:
+        if filename in pending_uploads:
+            return
+        pending_uploads.add(filename)
+    upload_pool.submit(run_upload, filename, file_path, deck_name, session_id, user_id)
+
+def deck_response(cards, deck_name):
+    """
+    Shared tail of the conversion endpoints: build the deck, start the Supabase
+    upload in the background and return the JSON response with a local download link
+    (or the Supabase link, for a reused deck whose upload has already finished).
+    With ?inline=1 the .apkg is returned directly, skipping the second download request.
+    """
+    if request.args.get('inline') == '1':
+        return inline_deck_response(cards, deck_name)
+
+    session_id = request.headers.get('X-Session-ID')
+    user_id = request.headers.get('X-User-ID')
+
+    # Build the deck (or reuse an identical recent one from the same session and user)
+    filename, file_path, file_size, media_count = build_deck(cards, deck_name, session_id, user_id)
+
+    # A deck reused from the recent-deck cache may already be on Supabase - hand out the permanent link
+    uploaded = finished_upload(filename) if SUPABASE_ENABLED else None
+    upload_pending = SUPABASE_ENABLED and not uploaded
+
+    if uploaded:
+        download_url = full_url = uploaded['download_url']
+        app.logger.info(f"✅ Using Supabase URL: {download_url}")
+    else:
+        # Upload to Supabase in the background - the local file is ready now, so don't make the client wait
+        if upload_pending:
+            start_upload(filename, file_path, deck_name, session_id=session_id, user_id=user_id)
+
+        # The local file stays after the upload, so this link works from every worker.
+        # If /api/cleanup later removes the file, /download redirects to the Supabase copy instead
+        download_url, full_url = local_download_urls(filename)
+        app.logger.info(f"📁 Local download ready: {full_url}")
+
+    result = {
+        'success': True,
+        'status': 'completed',
+        'deck_name': deck_name,
+        'cards_processed': len(cards),
+        'media_files_downloaded': media_count,
+        'file_size': file_size,
+        'filename': filename,
+        'download_url': download_url,
+        'full_download_url': full_url,
+        'storage_type': 'supabase' if uploaded else 'pending' if upload_pending else 'local',
+        'permanent_link': bool(uploaded),
+        'message': f'Successfully generated deck "{deck_name}" with {len(cards)} cards'
+    }
+    if upload_pending:
+        result['upload_status_url'] = f"/api/upload-status/{filename}"
+
+    return jsonify(result), 200
+
+# Tracebacks are always logged, but only sent to clients when debugging
+EXPOSE_TRACEBACK = os.environ.get('EXPOSE_TRACEBACK') == '1'
+
+def processing_error(e):
+    """500 response for a failed conversion - call from inside the except block"""
+    body = {
+        'error': 'Processing failed',
+        'message': str(e)
+    }
+    if app.debug or EXPOSE_TRACEBACK:
+        body['traceback'] = traceback.format_exc()
+    return jsonify(body), 500
+
+@app.errorhandler(InternalServerError)
+def internal_error(e):
+    """JSON 500 for exceptions no endpoint caught - Flask has already logged the traceback"""
+    body = {'error': 'Internal server error'}
+    original = e.original_exception
+    if original is not None and EXPOSE_TRACEBACK:
+        body['message'] = str(original)
+        body['traceback'] = ''.join(traceback.format_exception(original))
+    return jsonify(body), 500
+
+@app.route('/api/enhanced-medical', methods=['POST'])
+def api_enhanced_medical():
     try:
         app.logger.info("=== ENHANCED MEDICAL API CALLED ===")
 
         # Get JSON data
-        data = request.get_json(force=True)
+        data = read_json_body()
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
 
         # Log the structure we received
-        app.logger.debug(f"Received data structure: {type(data)}")
+        app.logger.debug("Received data structure: %s", type(data))
         if isinstance(data, dict):
-            app.logger.debug(f"Dict keys: {list(data.keys())}")
+            app.logger.debug("Dict keys: %s", list(data.keys()))
 
         # Extract deck name and cards
         deck_name = extract_deck_name(data)
         cards = extract_cards(data)
 
-        app.logger.debug(f"Extracted {len(cards) if cards else 0} cards")
+        # Lazy %-formatting - the first card isn't stringified unless DEBUG records are emitted
+        app.logger.debug("Extracted %d cards", len(cards) if cards else 0)
         if cards:
-            app.logger.debug(f"First card type: {type(cards[0]) if len(cards) > 0 else 'N/A'}")
-            app.logger.debug(f"First card content: {cards[0] if len(cards) > 0 else 'N/A'}")
+            app.logger.debug("First card type: %s", type(cards[0]))
+            app.logger.debug("First card content: %s", cards[0])
 
         if not cards:
             return jsonify({'error': 'No valid cards provided'}), 400
@@ -482,114 +1152,26 @@ def api_enhanced_medical():
         
         app.logger.info(f"Processing {len(cards)} cards for deck '{deck_name}'")
 
-        # Process cards
-        processor = EnhancedFlashcardProcessor()
-        deck, media_files = processor.process_cards(cards, deck_name)
-
-        # Create package
-        package = genanki.Package(deck)
-        package.media_files = media_files
-
-        # Generate filename and use persistent downloads directory
-        safe_name = "".join(c for c in deck_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        if not safe_name:
-            safe_name = "medical_deck"
-        
-        # Add timestamp to make filename unique
-        timestamp = int(time.time())
-        filename = f"{safe_name}_{timestamp}.apkg"
-        
-        # Create downloads directory if it doesn't exist
-        downloads_dir = os.path.join(os.getcwd(), 'downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        
-        # Files persist permanently - no automatic cleanup
-        # Use /api/cleanup endpoint if manual cleanup is needed
-        
-        file_path = os.path.join(downloads_dir, filename)
-
-        # Write package
-        package.write_to_file(file_path)
-
-        # Get file info
-        file_size = os.path.getsize(file_path)
-        app.logger.info(f"Generated deck: {file_path} (size: {file_size} bytes)")
-
-        # Clean up media files
-        for media_file in media_files:
-            try:
-                os.remove(media_file)
-            except:
-                pass
-
-        # Try to upload to Supabase
-        session_id = request.headers.get('X-Session-ID')
-        user_id = request.headers.get('X-User-ID')
-        
-        supabase_result = upload_deck_to_supabase(
-            file_path,
-            deck_name,
-            session_id=session_id,
-            user_id=user_id
-        )
-        
-        if supabase_result and supabase_result.get('success'):
-            # Use Supabase URL
-            download_url = supabase_result['download_url']
-            full_url = download_url
-            app.logger.info(f"✅ Using Supabase URL: {download_url}")
-        else:
-            # Fallback to local storage with proper URL generation
-            download_url = f"/download/{filename}"
-            # Get the proper host URL from request headers or environment
-            host = request.headers.get('Host', request.host)
-            # Use https for non-localhost hosts
-            protocol = 'https' if 'localhost' not in host and '127.0.0.1' not in host else 'http'
-            base_url = os.environ.get('BASE_URL', f"{protocol}://{host}")
-            full_url = f"{base_url.rstrip('/')}{download_url}"
-            app.logger.info(f"📁 Using local storage: {full_url}")
-
-        result = {
-            'success': True,
-            'status': 'completed',
-            'deck_name': deck_name,
-            'cards_processed': len(cards),
-            'media_files_downloaded': len(media_files),
-            'file_size': file_size,
-            'filename': filename,
-            'download_url': download_url,
-            'full_download_url': full_url,
-            'storage_type': 'supabase' if supabase_result else 'local',
-            'permanent_link': supabase_result is not None,
-            'message': f'Successfully generated deck "{deck_name}" with {len(cards)} cards'
-        }
-
-        return jsonify(result), 200
+        return deck_response(cards, deck_name)
 
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH - keep its status instead of turning it into a 500
+        raise
     except Exception as e:
-        app.logger.error(f"ERROR: {str(e)}")
-        import traceback
-        app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({
-            'error': 'Processing failed',
-            'message': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+        app.logger.exception("ERROR: %s", e)
+        return processing_error(e)
 
-@app.route('/api/simple', methods=['POST', 'OPTIONS'])
+@app.route('/api/simple', methods=['POST'])
 def api_simple():
     """Legacy compatibility endpoint"""
     return api_enhanced_medical()
 
-@app.route('/api/flexible-convert', methods=['POST', 'OPTIONS'])
+@app.route('/api/flexible-convert', methods=['POST'])
 def api_flexible_convert():
     """
     Simple endpoint for converting n8n markdown-wrapped JSON to Anki decks.
     Expects: ```json { "cards": [...] } ```
     """
-    if request.method == 'OPTIONS':
-        return '', 200
-
     try:
         app.logger.info("=== FLEXIBLE CONVERT API CALLED ===")
         
@@ -600,20 +1182,19 @@ def api_flexible_convert():
             return jsonify({'error': 'No data provided'}), 400
         
         app.logger.info(f"Received {len(raw_data)} bytes")
-        app.logger.debug(f"Preview: {raw_data[:200]}...")
+        app.logger.debug("Preview: %.200s...", raw_data)
         
         # Parse using our simple parser
         try:
             data = parse_markdown_json(raw_data)
             
             # Extract cards from the parsed data
-            if isinstance(data, dict) and 'cards' in data:
-                cards = data['cards']
-            elif isinstance(data, list):
-                # If it's a list, assume it's a list of cards
-                cards = data
-            else:
-                raise ValueError("JSON must contain a 'cards' array or be an array of cards")
+            match data:
+                case {'cards': _} | list():
+                    # Same validation as the other endpoints - non-dict cards are dropped here, once
+                    cards = extract_cards(data)
+                case _:
+                    raise ValueError("JSON must contain a 'cards' array or be an array of cards")
                 
         except Exception as e:
             return jsonify({
@@ -632,117 +1213,81 @@ def api_flexible_convert():
         deck_name = generate_smart_deck_name(cards)
         app.logger.info(f"Deck name: '{deck_name}'")
         
-        # Process cards
-        processor = EnhancedFlashcardProcessor()
-        deck, media_files = processor.process_cards(cards, deck_name)
-        
-        # Create package
-        package = genanki.Package(deck)
-        package.media_files = media_files
-        
-        # Generate filename
-        safe_name = "".join(c for c in deck_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        if not safe_name:
-            safe_name = "medical_deck"
-        
-        timestamp = int(time.time())
-        filename = f"{safe_name}_{timestamp}.apkg"
-        
-        # Create downloads directory
-        downloads_dir = os.path.join(os.getcwd(), 'downloads')
-        os.makedirs(downloads_dir, exist_ok=True)
-        
-        file_path = os.path.join(downloads_dir, filename)
-        
-        # Write package
-        package.write_to_file(file_path)
-        
-        # Get file info
-        file_size = os.path.getsize(file_path)
-        app.logger.info(f"Generated deck: {file_path} (size: {file_size} bytes)")
-        
-        # Clean up media files
-        for media_file in media_files:
-            try:
-                os.remove(media_file)
-            except:
-                pass
-        
-        # Try to upload to Supabase
-        session_id = request.headers.get('X-Session-ID')
-        user_id = request.headers.get('X-User-ID')
-        
-        supabase_result = upload_deck_to_supabase(
-            file_path,
-            deck_name,
-            session_id=session_id,
-            user_id=user_id
-        )
-        
-        if supabase_result and supabase_result.get('success'):
-            # Use Supabase URL
-            download_url = supabase_result['download_url']
-            full_url = download_url
-            app.logger.info(f"✅ Using Supabase URL: {download_url}")
-        else:
-            # Fallback to local storage with proper URL generation
-            download_url = f"/download/{filename}"
-            # Get the proper host URL from request headers or environment
-            host = request.headers.get('Host', request.host)
-            # Use https for non-localhost hosts
-            protocol = 'https' if 'localhost' not in host and '127.0.0.1' not in host else 'http'
-            base_url = os.environ.get('BASE_URL', f"{protocol}://{host}")
-            full_url = f"{base_url.rstrip('/')}{download_url}"
-            app.logger.info(f"📁 Using local storage: {full_url}")
-        
-        result = {
-            'success': True,
-            'status': 'completed',
-            'deck_name': deck_name,
-            'cards_processed': len(cards),
-            'media_files_downloaded': len(media_files),
-            'file_size': file_size,
-            'filename': filename,
-            'download_url': download_url,
-            'full_download_url': full_url,
-            'storage_type': 'supabase' if supabase_result and supabase_result.get('success') else 'local',
-            'message': f'Successfully generated deck "{deck_name}" with {len(cards)} cards'
-        }
-        
-        return jsonify(result), 200
+        return deck_response(cards, deck_name)
         
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH - keep its status instead of turning it into a 500
+        raise
     except Exception as e:
-        app.logger.error(f"ERROR in flexible-convert: {str(e)}")
-        import traceback
-        app.logger.error(f"Traceback: {traceback.format_exc()}")
-        return jsonify({
-            'error': 'Processing failed',
-            'message': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+        app.logger.exception("ERROR in flexible-convert: %s", e)
+        return processing_error(e)
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
+    # Only finished decks are served - not in-flight temp files or anything under a dot directory
+    if not filename.endswith('.apkg') or any(part.startswith('.') for part in filename.split('/')):
+        app.logger.warning(f"Refused download: {filename}")
+        return f"File not found: {filename}", 404
     try:
         # Look for file in persistent downloads directory
-        downloads_dir = os.path.join(os.getcwd(), 'downloads')
-        file_path = os.path.join(downloads_dir, filename)
-        
-        if not os.path.exists(file_path):
-            app.logger.warning(f"File not found: {file_path}")
-            return f"File not found: {filename}", 404
-
-        return send_file(
-            file_path,
+        # send_from_directory rejects path traversal and 404s missing files itself.
+        # conditional=True enables Range/304 responses and lets the WSGI server's
+        # file_wrapper (sendfile) stream the file instead of a Python read loop.
+        return send_from_directory(
+            DOWNLOADS_DIR,
+            filename,
             as_attachment=True,
-            download_name=filename,
-            mimetype='application/octet-stream'
+            download_name=os.path.basename(filename),
+            mimetype='application/octet-stream',
+            conditional=True
         )
+    except NotFound:
+        # Removed locally by /api/cleanup - send the client to the Supabase copy if there is one
+        uploaded = finished_upload(filename)
+        if uploaded:
+            return redirect(uploaded['download_url'])
+        app.logger.warning(f"File not found: {filename}")
+        return f"File not found: {filename}", 404
+    except HTTPException:
+        # e.g. 416 for a Range past the end of the file - keep its status instead of turning it into a 500
+        raise
     except Exception as e:
         app.logger.error(f"Download error: {e}")
         return "Download failed", 500
 
-@app.route('/api/repair-json', methods=['POST', 'OPTIONS'])
+@app.route('/api/upload-status/<path:filename>')
+def upload_status(filename):
+    """Report whether a deck's background Supabase upload has finished - answered from disk, so any worker can"""
+    record = load_upload_record(filename)
+    if record is None:
+        # No result yet: the upload is still running if the deck itself exists
+        deck_path = safe_join(DOWNLOADS_DIR, filename)
+        if SUPABASE_ENABLED and deck_path and os.path.isfile(deck_path):
+            return jsonify({'status': 'pending', 'storage_type': 'pending', 'filename': filename}), 200
+        return jsonify({'error': 'Unknown upload', 'filename': filename}), 404
+
+    if record.get('success'):
+        return jsonify({
+            'status': 'completed',
+            'storage_type': 'supabase',
+            'filename': filename,
+            'download_url': record['download_url'],
+            'full_download_url': record['download_url'],
+            'permanent_link': True
+        }), 200
+
+    # Upload failed - the deck stays in local storage
+    download_url, full_url = local_download_urls(filename)
+    return jsonify({
+        'status': 'failed',
+        'storage_type': 'local',
+        'filename': filename,
+        'download_url': download_url,
+        'full_download_url': full_url,
+        'permanent_link': False
+    }), 200
+
+@app.route('/api/repair-json', methods=['POST'])
 def api_repair_json():
     """
     JSON repair-only endpoint for cleaning LLM-generated JSON.
@@ -754,9 +1299,6 @@ def api_repair_json():
     This endpoint is designed for n8n workflows that need to clean malformed JSON
     and receive it back in the same markdown format for further processing.
     """
-    if request.method == 'OPTIONS':
-        return '', 200
-    
     try:
         app.logger.info("=== JSON REPAIR API CALLED ===")
         
@@ -767,14 +1309,14 @@ def api_repair_json():
             return jsonify({'error': 'No data provided'}), 400
         
         app.logger.info(f"Received {len(raw_data)} bytes for repair")
-        app.logger.debug(f"Preview: {raw_data[:200]}...")
+        app.logger.debug("Preview: %.200s...", raw_data)
         
         # Parse and repair JSON
         try:
             repaired_data = parse_markdown_json(raw_data)
             
             # Format the repaired JSON with proper indentation
-            formatted_json = json.dumps(repaired_data, indent=2, ensure_ascii=False)
+            formatted_json = orjson.dumps(repaired_data, option=orjson.OPT_INDENT_2).decode()
             
             # Wrap in markdown code block
             markdown_response = f"```json\n{formatted_json}\n```"
@@ -788,44 +1330,69 @@ def api_repair_json():
             app.logger.error(error_message)
             return error_message, 400, {'Content-Type': 'text/plain; charset=utf-8'}
             
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH - keep its status instead of turning it into a 500
+        raise
     except Exception as e:
-        app.logger.error(f"ERROR in repair-json: {str(e)}")
-        import traceback
-        app.logger.error(f"Traceback: {traceback.format_exc()}")
+        app.logger.exception("ERROR in repair-json: %s", e)
         error_message = f"Processing failed: {str(e)}"
         return error_message, 500, {'Content-Type': 'text/plain; charset=utf-8'}
 
-@app.route('/api/health', methods=['GET'])
-def api_health():
-    return jsonify({
-        'status': 'healthy',
-        'service': 'Enhanced Medical Anki Generator',
-        'version': '11.1.0',
-        'features': [
-            'json_repair_parsing',
-            'markdown_code_block_extraction',
-            'smart_deck_naming_from_tags',
-            'supabase_permanent_storage',
-            'cloze_card_support',
-            'images_array_support',
-            'clinical_vignettes_preserved',
-            'permanent_download_links',
-            'json_repair_only_endpoint'
-        ],
-        'json_repair_status': 'required',
-        'storage': {
-            'supabase_enabled': SUPABASE_ENABLED,
-            'bucket': 'synapticrecall-links' if SUPABASE_ENABLED else None,
-            'fallback': 'local_storage'
-        },
-        'endpoints': {
-            '/api/repair-json': 'JSON repair only - returns markdown-wrapped JSON (text/plain)',
-            '/api/flexible-convert': 'Primary endpoint with json repair + APKG',
-            '/api/enhanced-medical': 'Legacy endpoint with standard JSON parsing',
-            '/api/simple': 'Legacy compatibility endpoint'
-        },
-        'timestamp': int(time.time())
-    }), 200
+# Lets a proxy or CDN absorb bursts of health probes without the status going stale
+HEALTH_MAX_AGE = 10
+
+# Everything in the health payload but the timestamp is fixed for the life of the process:
+# encode it once (same key order and options as jsonify) and only format the timestamp per request
+HEALTH_JSON_TEMPLATE = orjson.dumps({
+    'status': 'healthy',
+    'service': 'Enhanced Medical Anki Generator',
+    'version': '11.1.0',
+    'features': [
+        'json_repair_parsing',
+        'markdown_code_block_extraction',
+        'smart_deck_naming_from_tags',
+        'supabase_permanent_storage',
+        'cloze_card_support',
+        'images_array_support',
+        'clinical_vignettes_preserved',
+        'permanent_download_links',
+        'json_repair_only_endpoint'
+    ],
+    'json_repair_status': 'required',
+    'storage': {
+        'supabase_enabled': SUPABASE_ENABLED,
+        'bucket': 'synapticrecall-links' if SUPABASE_ENABLED else None,
+        'fallback': 'local_storage'
+    },
+    'endpoints': {
+        '/api/repair-json': 'JSON repair only - returns markdown-wrapped JSON (text/plain)',
+        '/api/flexible-convert': 'Primary endpoint with json repair + APKG',
+        '/api/enhanced-medical': 'Legacy endpoint with standard JSON parsing',
+        '/api/simple': 'Legacy compatibility endpoint',
+        '/api/upload-status/<filename>': 'Background Supabase upload status for a generated deck'
+    },
+    'timestamp': None
+}, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE).replace(b'%', b'%%').replace(b'"timestamp":null', b'"timestamp":%d')
+
+HEALTH_CACHE_CONTROL = f'public, max-age={HEALTH_MAX_AGE}'
+
+def health_shortcut(wsgi_app):
+    """Answer GET/HEAD /api/health directly, before Flask builds a request context - the probe needs none of it"""
+    def wrapped(environ, start_response):
+        method = environ.get('REQUEST_METHOD')
+        if environ.get('PATH_INFO') == '/api/health' and method in ('GET', 'HEAD'):
+            body = HEALTH_JSON_TEMPLATE % int(time.time())
+            start_response('200 OK', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(body))),
+                ('Cache-Control', HEALTH_CACHE_CONTROL),
+                ('Access-Control-Allow-Origin', '*')
+            ])
+            return [body] if method == 'GET' else []
+        return wsgi_app(environ, start_response)
+    return wrapped
+
+app.wsgi_app = health_shortcut(app.wsgi_app)
 
 @app.route('/api/health/supabase', methods=['GET'])
 def api_health_supabase():
@@ -837,32 +1404,33 @@ def api_health_supabase():
 @app.route('/api/cleanup', methods=['POST'])
 def api_cleanup():
     """Manual cleanup endpoint for administrative use"""
+    # A missing or non-JSON body means the default threshold
+    data = request.get_json(silent=True)
+    days = data.get('days', 30) if data else 30
+
+    cutoff_time = time.time() - (days * 24 * 60 * 60)
+
+    # Only filesystem errors are expected here - anything else is a bug and goes to Flask's 500 handler
     try:
-        days = request.json.get('days', 30) if request.json else 30
-        downloads_dir = os.path.join(os.getcwd(), 'downloads')
-        
-        cleaned_files = []
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        
-        for filename in os.listdir(downloads_dir):
-            file_path = os.path.join(downloads_dir, filename)
-            if os.path.isfile(file_path):
-                if os.path.getmtime(file_path) < cutoff_time:
-                    os.remove(file_path)
-                    cleaned_files.append(filename)
-        
-        return jsonify({
-            'status': 'completed',
-            'cleaned_files': cleaned_files,
-            'days_threshold': days,
-            'message': f'Cleaned {len(cleaned_files)} files older than {days} days'
-        }), 200
-    except Exception as e:
+        # scandir gets the file type from the directory read - one stat per file for its mtime
+        with os.scandir(DOWNLOADS_DIR) as entries:
+            expired = [entry for entry in entries if entry.is_file() and entry.stat().st_mtime < cutoff_time]
+        for entry in expired:
+            os.remove(entry.path)
+    except OSError as e:
+        app.logger.error(f"Cleanup failed: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/')
-def index():
-    return """
+    cleaned_files = [entry.name for entry in expired]
+    return jsonify({
+        'status': 'completed',
+        'cleaned_files': cleaned_files,
+        'days_threshold': days,
+        'message': f'Cleaned {len(cleaned_files)} files older than {days} days'
+    }), 200
+
+# The landing page is static: encode it and hash it once at import time
+INDEX_HTML = """
     <!DOCTYPE html>
     <html>
     <head>
@@ -932,7 +1500,32 @@ def index():
         </div>
     </body>
     </html>
-    """
+    """.encode('utf-8')
+INDEX_ETAG = hashlib.blake2b(INDEX_HTML, digest_size=16, usedforsecurity=False).hexdigest()
+# Pre-compressed copy for clients that accept gzip - no per-request compression
+INDEX_HTML_GZIP = gzip.compress(INDEX_HTML, compresslevel=9, mtime=0)
+INDEX_GZIP_ETAG = f"{INDEX_ETAG}-gzip"
+INDEX_MAX_AGE = 3600
+# The page only changes with a deploy, so the process start time serves as Last-Modified
+INDEX_LAST_MODIFIED = int(time.time())
+
+@app.route('/')
+def index():
+    if request.accept_encodings['gzip']:
+        response = app.response_class(INDEX_HTML_GZIP, mimetype='text/html')
+        response.content_encoding = 'gzip'
+        response.set_etag(INDEX_GZIP_ETAG)
+    else:
+        response = app.response_class(INDEX_HTML, mimetype='text/html')
+        response.set_etag(INDEX_ETAG)
+    response.vary.add('Accept-Encoding')
+    response.last_modified = INDEX_LAST_MODIFIED
+    response.cache_control.public = True
+    response.cache_control.max_age = INDEX_MAX_AGE
+    # Answers If-None-Match with a bodiless 304
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Development server only - production runs under gunicorn (see gunicorn.conf.py).
+    # The reloader's file-watcher stays off even with FLASK_DEBUG=1 - restart by hand after edits
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', use_reloader=False)
\ No newline at end of file
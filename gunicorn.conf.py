@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for production deployment
+Loaded automatically when gunicorn is started from the project root
+"""
+import os
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# One worker process per usable core - deck generation is CPU-bound pure Python.
+# Count the CPUs this process may run on rather than the host's, and cap it: every worker also
+# starts its own image download and upload thread pools, so memory and outbound connections grow with it
+MAX_DEFAULT_WORKERS = 4
+usable_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+workers = int(os.environ.get("WEB_CONCURRENCY", min(usable_cpus, MAX_DEFAULT_WORKERS)))
+
+# Threads let a worker keep serving while another request waits on
+# image downloads, the .apkg write or the Supabase upload.
+# GUNICORN_WORKER_CLASS=gevent switches to cooperative workers (needs gevent installed)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Code reloading for development - GUNICORN_RELOAD=1, or --reload on the command line (the .replit workflow)
+reload = os.environ.get("GUNICORN_RELOAD") == "1" or "--reload" in sys.argv
+
+# Import the app once in the master so workers share it copy-on-write.
+# gevent must patch the stdlib before the app imports requests, so it loads per worker instead.
+# The reloader can't pick up edits to a preloaded app, so preloading is off while reloading
+preload_app = worker_class != "gevent" and not reload
+
+# /download responses go through wsgi.file_wrapper - let the kernel copy the .apkg to the socket
+sendfile = True
+
+# Large decks with many images can take a while to build
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
@@ -1,5 +1,6 @@
 from app import app, JSON_REPAIR_AVAILABLE
 import logging
+import os
 
 if __name__ == '__main__':
     # Log whether json_repair is available
@@ -9,4 +10,6 @@ if __name__ == '__main__':
         logging.warning("⚠️  json_repair package not found - using fallback parser")
         logging.warning("⚠️  To install: pip install json_repair")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only - production runs under gunicorn (see gunicorn.conf.py).
+    # The reloader's file-watcher stays off even with FLASK_DEBUG=1 - restart by hand after edits
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', use_reloader=False)
@@ -3,8 +3,9 @@ Supabase utilities for SynapticRecall Flashcard Converter
 Handles deck uploads with intelligent naming based on lecture tags
 """
 import os
+import re
+import time
 import logging
-from datetime import datetime
 from typing import Optional, Dict, List
 from supabase import create_client, Client
 
@@ -25,6 +26,34 @@ except Exception as e:
     supabase = None
     SUPABASE_ENABLED = False
 
+class SafeFilenameTable(dict):
+    """
+    str.translate table that keeps letters, digits, spaces, '-' and '_' and deletes everything else.
+    Each code point is classified once, on first sight, so any Unicode name is handled in one C-level pass.
+    """
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        keep = char.isalnum() or char in (' ', '-', '_')
+        self[codepoint] = codepoint if keep else None
+        return self[codepoint]
+
+SAFE_FILENAME_TABLE = SafeFilenameTable()
+
+def sanitize_filename(name: str) -> str:
+    """
+    Keep only characters that are safe in deck filenames and storage paths
+    
+    Args:
+        name: Deck name or tag
+        
+    Returns:
+        The name with everything except letters, digits, spaces, '-' and '_' removed
+    """
+    return name.translate(SAFE_FILENAME_TABLE).strip()
+
+# System tags to filter out - one alternation instead of a substring scan per tag
+SYSTEM_TAG_RE = re.compile(r'synapticrecall|synaptic_recall|medical|flashcard|anki')
+
 def extract_lecture_name_from_tags(tags: List[str]) -> str:
     """
     Extract the lecture name from tags by filtering out system tags
@@ -38,23 +67,22 @@ def extract_lecture_name_from_tags(tags: List[str]) -> str:
     if not tags:
         return "Medical_Lecture"
     
-    # System tags to filter out
-    system_tags = ["synapticrecall", "synaptic_recall", "medical", "flashcard", "anki"]
+    # Lowercase each tag once - both passes below reuse it
+    lowered_tags = [(tag, tag.lower()) for tag in tags]
     
     # Find the first tag that's not a system tag
-    for tag in tags:
-        tag_lower = tag.lower().strip()
-        if not any(sys_tag in tag_lower for sys_tag in system_tags):
+    for tag, tag_lower in lowered_tags:
+        if not SYSTEM_TAG_RE.search(tag_lower):
             # This is likely the lecture name
             # Clean it up for use as a filename
-            clean_name = "".join(c for c in tag if c.isalnum() or c in (' ', '-', '_')).strip()
+            clean_name = sanitize_filename(tag)
             if clean_name:
                 return clean_name
     
     # If all tags are system tags, use the first non-synapticrecall tag
-    for tag in tags:
-        if "synapticrecall" not in tag.lower():
-            clean_name = "".join(c for c in tag if c.isalnum() or c in (' ', '-', '_')).strip()
+    for tag, tag_lower in lowered_tags:
+        if "synapticrecall" not in tag_lower:
+            clean_name = sanitize_filename(tag)
             if clean_name:
                 return clean_name
     
@@ -103,7 +131,8 @@ def upload_deck_to_supabase(
     local_file_path: str,
     deck_name: str,
     session_id: Optional[str] = None,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    delete_local: bool = True
 ) -> Optional[Dict]:
     """
     Upload .apkg file to Supabase with organized folder structure
@@ -113,6 +142,7 @@ def upload_deck_to_supabase(
         deck_name: Smart deck name (lecture name)
         session_id: Optional session ID from n8n
         user_id: Optional user ID
+        delete_local: Remove the local file once the upload has succeeded
         
     Returns:
         Dict with permanent public URL and metadata
@@ -127,22 +157,22 @@ def upload_deck_to_supabase(
             file_data = f.read()
         
         # Create organized path: YYYY/MM/sessions/[session_id]/lecture_name.apkg
-        now = datetime.now()
+        now = time.localtime()
         
         # Clean deck name for filename
-        safe_deck_name = "".join(c for c in deck_name if c.isalnum() or c in (' ', '-', '_')).strip()
+        safe_deck_name = sanitize_filename(deck_name)
         if not safe_deck_name:
             safe_deck_name = "medical_deck"
         
         # Build path components
-        year_month = f"{now.year}/{now.month:02d}"
+        year_month = time.strftime("%Y/%m", now)
         
         if session_id:
             # If we have session ID, use it for organization
             storage_path = f"{year_month}/sessions/{session_id}/{safe_deck_name}.apkg"
         else:
             # Fallback path without session ID
-            timestamp = now.strftime("%Y%m%d_%H%M%S")
+            timestamp = time.strftime("%Y%m%d_%H%M%S", now)
             storage_path = f"{year_month}/decks/{safe_deck_name}_{timestamp}.apkg"
         
         # Upload to Supabase
@@ -162,18 +192,19 @@ def upload_deck_to_supabase(
         public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{storage_path}"
         
         # Delete local file after successful upload
-        try:
-            os.remove(local_file_path)
-            logger.info(f"🗑️ Deleted local file: {local_file_path}")
-        except Exception as e:
-            logger.warning(f"Could not delete local file: {e}")
+        if delete_local:
+            try:
+                os.remove(local_file_path)
+                logger.info(f"🗑️ Deleted local file: {local_file_path}")
+            except Exception as e:
+                logger.warning(f"Could not delete local file: {e}")
         
         result = {
             "success": True,
             "download_url": public_url,
             "storage_path": storage_path,
             "deck_name": deck_name,
-            "uploaded_at": now.isoformat(),
+            "uploaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", now),
             "permanent": True,
             "message": f"Deck '{deck_name}' uploaded successfully"
         }